@@ -3,18 +3,20 @@ import hashlib
 import logging
 import logging.config
 from datetime import datetime, timezone
+from enum import Enum
 from io import BytesIO
 from pathlib import Path
+import shutil
 import subprocess
 from typing import Any
 
 import requests
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from typing_extensions import Self
 
 from fabric import Fabric, FabricYarn
 from jardescs import JarDescs, JarDescsMapping
-from util import progress, sort_dict
+from util import progress, sha1_file, sort_dict, zip_dir
 
 
 DIR = Path(__file__).parent
@@ -27,24 +29,106 @@ logging.config.fileConfig("logging.conf")
 logger = logging.getLogger("combined")
 
 
-class CombinedJarDesc(JarDescsMapping):
-    pass
+# mapping-io-cli FORMAT values, mapping-io-cli 0.3.0 can not write ProGuard
+class OutputFormat(str, Enum):
+    JSON = "JSON"
+    TINY = "TINY"
+    TINY_2 = "TINY_2"
+    ENIGMA = "ENIGMA"
 
     @property
-    def out_path(self) -> Path:
-        return Path(MAPPINGS_DIR / f"{self.version_id}-{self.jar_key}.json")
+    def suffix(self) -> str:
+        return OUTPUT_FORMAT_SUFFIXES[self]
+
+
+# ENIGMA is written as a directory, published as a zip of it
+OUTPUT_FORMAT_SUFFIXES = {
+    OutputFormat.JSON: ".json",
+    OutputFormat.TINY: "-v1.tiny",
+    OutputFormat.TINY_2: ".tiny",
+    OutputFormat.ENIGMA: "-enigma.zip",
+}
+DEFAULT_OUTPUT_FORMATS = [OutputFormat.JSON]
+
+
+class CombinedJarDesc(JarDescsMapping):
+    formats: list[OutputFormat] = DEFAULT_OUTPUT_FORMATS
+    in_sha1: str | None = None
+    out_sha1: dict[OutputFormat, str] = dict()
+
+    @validator("out_sha1", pre=True)
+    def validate_out_sha1(cls, out_sha1: Any) -> Any:
+        # out_sha1 used to be the optional sha1 of the JSON output only
+        if out_sha1 is None:
+            return dict()
+        if isinstance(out_sha1, str):
+            return {OutputFormat.JSON: out_sha1}
+        return out_sha1
+
+    def get_out_path(self, format: OutputFormat) -> Path:
+        return Path(MAPPINGS_DIR / f"{self.version_id}-{self.jar_key}{format.suffix}")
 
     @classmethod
     def from_jar_descs_mapping(cls, jar_descs_mapping: JarDescsMapping) -> Self:
         return CombinedJarDesc.parse_obj(jar_descs_mapping)
 
-    def mappingio(self, yarn: "CombinedYarn") -> None:
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, CombinedJarDesc):
+            return (
+                self.version_id == other.version_id
+                and self.version_file_id == other.version_file_id
+                and self.version_release_time == other.version_release_time
+                and self.jar_key == other.jar_key
+                and self.jar_sha1_meta == other.jar_sha1_meta
+            )
+        return False
+
+    def input_sha1(self, yarn_tiny_sha1: str) -> str:
+        # combine with the yarn hash so the shared yarn is only read once per version
+        return hashlib.sha1(f"{sha1_file(self.path)}{yarn_tiny_sha1}".encode()).hexdigest()
+
+    def mappingio(
+        self,
+        yarn: "CombinedYarn",
+        formats: list[OutputFormat] = DEFAULT_OUTPUT_FORMATS,
+    ) -> None:
+        # merge once, then convert the merged file into the remaining formats.
+        # mapping-io-cli can not read JSON, so Tiny v2 is merged if there is more than one format
+        merge_format = formats[0] if len(formats) == 1 else OutputFormat.TINY_2
+        merge_path = self.get_out_path(merge_format)
+
+        for format in OutputFormat:
+            if format not in formats:
+                # dropped or never configured, also when self.formats was reset by a jar update
+                self.get_out_path(format).unlink(missing_ok=True)
+
+        self._mappingio("yarnfulldescs", self.path, yarn.path, merge_path, merge_format)
+        for format in formats:
+            if format == merge_format:
+                continue
+
+            if format == OutputFormat.ENIGMA:
+                enigma_dir = self.get_out_path(format).with_suffix("")
+                if enigma_dir.exists():
+                    # remove stale class files
+                    shutil.rmtree(enigma_dir)
+                self._mappingio("convert", merge_path, enigma_dir, format)
+                zip_dir(enigma_dir, self.get_out_path(format))
+                shutil.rmtree(enigma_dir)
+            else:
+                self._mappingio("convert", merge_path, self.get_out_path(format), format)
+
+        if merge_format not in formats:
+            merge_path.unlink()
+
+        self.formats = list(formats)
+        self.in_sha1 = self.input_sha1(yarn.get_tiny_sha1())
+        self.out_sha1 = {format: sha1_file(self.get_out_path(format)) for format in formats}
+
+    def _mappingio(self, command: str, *args: Path | OutputFormat) -> None:
         mappingio_args = [
-            "yarnfulldescs",
-            self.path.relative_to(Path.cwd()),
-            yarn.path.relative_to(Path.cwd()),
-            self.out_path.relative_to(Path.cwd()),
-            "JSON",
+            command,
+            *[arg.relative_to(Path.cwd()) if isinstance(arg, Path) else arg.value for arg in args],
         ]
         logger.info(f"CombinedJarDesc.mappingio {' '.join(str(arg) for arg in mappingio_args)}")
         return_code = subprocess.call(["java", "-jar", MAPPINGIO_JAR, *mappingio_args])
@@ -55,11 +139,17 @@ class CombinedJarDesc(JarDescsMapping):
 class CombinedYarn(FabricYarn):
     version_id: str
     version_release_time: datetime
+    tiny_gz_sha1: str | None = None
+    tiny_sha1: str | None = None
 
     @property
     def path(self) -> Path:
         return Path(MAPPINGS_DIR / f"{self.version_id}-yarn.tiny")
 
+    @property
+    def cache_path(self) -> Path:
+        return self.path.with_suffix(".tiny.gz")
+
     @classmethod
     def from_fabric_yarn(
         cls,
@@ -96,23 +186,32 @@ class CombinedYarn(FabricYarn):
             "separator",
             "build",
             "fabric_name",
+            "tiny_gz_sha1",
+            "tiny_sha1",
         ]:
             yield key, getattr(self, key)
 
-    def download(self) -> None:
-        cache = self.path.with_suffix(".tiny.gz")
+    def get_tiny_sha1(self) -> str:
+        if self.tiny_sha1 is None:
+            self.tiny_sha1 = sha1_file(self.path)
+        return self.tiny_sha1
+
+    def download(self, force: bool = False) -> None:
+        cache = self.cache_path
 
         cache_hit = False
-        if cache.exists() and self.path.exists():
+        if not force and cache.exists() and self.path.exists():
             logger.info(f"CombinedYarn.download {self.tiny_gz_url}.sha1")
             r = requests.get(self.tiny_gz_url + ".sha1")
             r.raise_for_status()
 
             online_sha1 = r.text
-            local_sha1 = hashlib.sha1(cache.read_bytes()).hexdigest()
+            local_sha1 = sha1_file(cache)
             cache_hit = online_sha1 == local_sha1
 
         if cache_hit:
+            self.tiny_gz_sha1 = local_sha1
+            self.tiny_sha1 = sha1_file(self.path)
             logger.info(f"CombinedYarn.download {self.tiny_gz_url} cache hit")
             return
 
@@ -121,7 +220,10 @@ class CombinedYarn(FabricYarn):
         r.raise_for_status()
 
         cache.write_bytes(r.content)
-        self.path.write_text(gzip.open(BytesIO(r.content)).read().decode("utf-8"))
+        tiny = gzip.open(BytesIO(r.content)).read()
+        self.path.write_bytes(tiny)
+        self.tiny_gz_sha1 = hashlib.sha1(r.content).hexdigest()
+        self.tiny_sha1 = hashlib.sha1(tiny).hexdigest()
 
 
 class CombinedCombined(BaseModel):
@@ -131,7 +233,12 @@ class CombinedCombined(BaseModel):
     yarn: CombinedYarn
     jars: dict[str, CombinedJarDesc]
 
-    def update(self, fabric_yarn: FabricYarn, jar_descs_mappings: list[JarDescsMapping]) -> bool:
+    def update(
+        self,
+        fabric_yarn: FabricYarn,
+        jar_descs_mappings: list[JarDescsMapping],
+        formats: list[OutputFormat] = DEFAULT_OUTPUT_FORMATS,
+    ) -> bool:
         dirty = False
         yarn_dirty = False
 
@@ -155,9 +262,13 @@ class CombinedCombined(BaseModel):
                 dirty = True
                 jar_dirty = True
 
+            if self.jars[mapping.jar_key].formats != formats:
+                dirty = True
+                jar_dirty = True
+
             if yarn_dirty or jar_dirty:
                 # create or update mapping files
-                new_jar.mappingio(self.yarn)
+                self.jars[mapping.jar_key].mappingio(self.yarn, formats)
 
         if dirty:
             # sort
@@ -165,18 +276,45 @@ class CombinedCombined(BaseModel):
 
         return dirty
 
-    def mappingio(self) -> None:
+    def mappingio(self, formats: list[OutputFormat] = DEFAULT_OUTPUT_FORMATS) -> None:
         logger.info(f"CombinedCombined.mappingio")
         for jar in self.jars.values():
-            jar.mappingio(self.yarn)
+            jar.mappingio(self.yarn, formats)
 
 
 class Combined(BaseModel):
     timestamp: datetime
     jar_descs_timestamp: datetime
     fabric_timestamp: datetime
+    formats: list[OutputFormat] = DEFAULT_OUTPUT_FORMATS
     combined: dict[str, CombinedCombined]
 
+    @validator("formats")
+    def validate_formats(cls, formats: list[OutputFormat]) -> list[OutputFormat]:
+        if OutputFormat.JSON not in formats:
+            # index.json path and url are JSON for clients predating formats
+            raise ValueError("JSON output format is required")
+        # remove duplicates, keep order
+        return list(dict.fromkeys(formats))
+
+    def is_formats_dirty(self, fabric: Fabric, jar_descs: JarDescs) -> bool:
+        # only jars update can regenerate, orphaned ones would keep this dirty forever
+        for combined in self.combined.values():
+            if (
+                combined.version_file_id not in fabric.yarn
+                or combined.version_id not in jar_descs.mappings
+            ):
+                continue
+
+            for jar_key, jar in combined.jars.items():
+                if (
+                    jar_key in jar_descs.mappings[combined.version_id]
+                    and jar.formats != self.formats
+                ):
+                    return True
+
+        return False
+
     @classmethod
     def empty(cls) -> Self:
         return cls(
@@ -211,6 +349,7 @@ class Combined(BaseModel):
         if (
             self.fabric_timestamp == fabric.timestamp
             and self.jar_descs_timestamp == jar_descs.timestamp
+            and not self.is_formats_dirty(fabric, jar_descs)
         ):
             # no changes, nothing to do
             logger.info("Combined.update already up to date")
@@ -247,7 +386,7 @@ class Combined(BaseModel):
                     yarn=combined_yarn,
                     jars=combined_jars,
                 )
-                self.combined[version_id].mappingio()
+                self.combined[version_id].mappingio(self.formats)
                 dirty = True
                 logger.info(f"{prefix_end} {version_id} initialized")
                 continue
@@ -256,6 +395,7 @@ class Combined(BaseModel):
             combined_dirty = self.combined[version_id].update(
                 fabric_yarn=fabric_yarn,
                 jar_descs_mappings=jar_descs.get_jars(version_id),
+                formats=self.formats,
             )
 
             if combined_dirty:
@@ -6,7 +6,13 @@ from pathlib import Path
 from pydantic import BaseModel
 from typing_extensions import Self
 
-from combined import DEFAULT_COMBINED_JSON, Combined, CombinedCombined, CombinedJarDesc
+from combined import (
+    DEFAULT_COMBINED_JSON,
+    Combined,
+    CombinedCombined,
+    CombinedJarDesc,
+    OutputFormat,
+)
 
 
 DIR = Path(__file__).parent
@@ -18,6 +24,16 @@ logging.config.fileConfig("logging.conf")
 logger = logging.getLogger("index")
 
 
+class IndexJarFormat(BaseModel):
+    path: Path
+    url: str
+
+    @classmethod
+    def from_path(cls, path: Path) -> Self:
+        path = path.relative_to(DIR)
+        return cls(path=path, url=f"{BASE_URL}/{path}")
+
+
 class IndexJar(BaseModel):
     version_id: str
     version_file_id: str
@@ -25,20 +41,28 @@ class IndexJar(BaseModel):
     yarn_build: int
     jar_key: str
 
+    # JSON, kept for clients predating formats
     path: Path
     url: str
 
+    formats: dict[OutputFormat, IndexJarFormat] = dict()
+
     @classmethod
     def from_combined_jar(cls, combined_jar: CombinedJarDesc, yarn_build: int) -> Self:
-        path = combined_jar.out_path.relative_to(DIR)
+        formats = {
+            format: IndexJarFormat.from_path(combined_jar.get_out_path(format))
+            for format in combined_jar.formats
+        }
+        json_format = IndexJarFormat.from_path(combined_jar.get_out_path(OutputFormat.JSON))
         return cls(
             version_id=combined_jar.version_id,
             version_file_id=combined_jar.version_file_id,
             version_release_time=combined_jar.version_release_time,
             yarn_build=yarn_build,
             jar_key=combined_jar.jar_key,
-            path=path,
-            url=f"{BASE_URL}/{path}",
+            path=json_format.path,
+            url=json_format.url,
+            formats=formats,
         )
 
 
@@ -28,9 +28,10 @@ def update(push: bool = False) -> None:
         fabric.save()
         new_data = True
 
-    if new_data:
-        # update combined
-        combined = Combined.load()
+    # update combined, also when its configured formats changed.
+    # pull_and_update does not reload jar_descs
+    combined = Combined.load()
+    if new_data or combined.is_formats_dirty(fabric, JarDescs.load()):
         if combined.update():
             combined.save()
 
@@ -1,4 +1,7 @@
-from typing import Any, Callable, TypeVar
+import hashlib
+import zipfile
+from pathlib import Path
+from typing import IO, Any, Callable, TypeVar
 
 
 class StrAlias:
@@ -23,3 +26,26 @@ def sort_dict(
     reverse: bool = False,
 ) -> dict[K, V]:
     return {k: v for k, v in sorted(dict_in.items(), key=key, reverse=reverse)}
+
+
+def sha1_file(
+    *files: Path,
+    opener: Callable[[Path], IO[bytes]] = lambda file: open(file, "rb"),
+    chunk_size: int = 1024 * 1024,
+) -> str:
+    sha1 = hashlib.sha1()
+    for file in files:
+        with opener(file) as f:
+            while chunk := f.read(chunk_size):
+                sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def zip_dir(directory: Path, file: Path) -> None:
+    # fixed timestamps, unchanged files give an unchanged zip
+    with zipfile.ZipFile(file, "w") as zip_file:
+        for path in sorted(directory.rglob("*")):
+            if path.is_file():
+                info = zipfile.ZipInfo(path.relative_to(directory).as_posix())
+                info.compress_type = zipfile.ZIP_DEFLATED
+                zip_file.writestr(info, path.read_bytes())
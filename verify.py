@@ -0,0 +1,288 @@
+import gzip
+import json
+import logging
+import logging.config
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import requests
+from pydantic import BaseModel
+
+from combined import DIR, Combined, CombinedCombined, CombinedJarDesc, CombinedYarn, OutputFormat
+from index import Index, IndexVersion
+from util import progress, sha1_file
+
+
+logging.config.fileConfig("logging.conf")
+logger = logging.getLogger("verify")
+
+
+class VerifyResult(BaseModel):
+    version_id: str
+    jar_key: str | None = None
+    errors: list[str]
+
+    # hashes computed during verification, recorded in combined.json when valid
+    tiny_gz_sha1: str | None = None
+    tiny_sha1: str | None = None
+    in_sha1: str | None = None
+    out_sha1: dict[OutputFormat, str] = dict()
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def name(self) -> str:
+        return f"{self.version_id}-{self.jar_key or 'yarn'}"
+
+
+def verify_yarn(yarn: CombinedYarn) -> VerifyResult:
+    result = VerifyResult(version_id=yarn.version_id, errors=list())
+    cache_name = yarn.cache_path.relative_to(DIR)
+    tiny_name = yarn.path.relative_to(DIR)
+    try:
+        for path in [yarn.cache_path, yarn.path]:
+            if not path.exists():
+                result.errors.append(f"missing {path.relative_to(DIR)}")
+        if result.errors:
+            return result
+
+        # cache must match maven
+        r = requests.get(yarn.tiny_gz_url + ".sha1")
+        r.raise_for_status()
+        result.tiny_gz_sha1 = sha1_file(yarn.cache_path)
+        if result.tiny_gz_sha1 != r.text.strip():
+            result.errors.append(f"{cache_name} sha1 does not match maven")
+        elif yarn.tiny_gz_sha1 is not None and result.tiny_gz_sha1 != yarn.tiny_gz_sha1:
+            result.errors.append(f"{cache_name} sha1 does not match recorded sha1")
+
+        # tiny must be the decompressed cache
+        result.tiny_sha1 = sha1_file(yarn.path)
+        if sha1_file(yarn.cache_path, opener=gzip.open) != result.tiny_sha1:
+            result.errors.append(f"{tiny_name} does not match {cache_name}")
+    except Exception as e:
+        result.errors.append(f"{type(e).__name__}: {e}")
+    return result
+
+
+def validate_json(path: Path) -> bool:
+    with open(path, "rb") as f:
+        data = json.load(f)
+    return isinstance(data, dict) and bool(data)
+
+
+def validate_tiny(path: Path) -> bool:
+    with open(path, encoding="utf-8") as f:
+        return f.readline().startswith("v1\t")
+
+
+def validate_tiny_2(path: Path) -> bool:
+    with open(path, encoding="utf-8") as f:
+        return f.readline().startswith("tiny\t2\t")
+
+
+def validate_enigma(path: Path) -> bool:
+    if not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as zip_file:
+        return zip_file.testzip() is None and any(
+            name.endswith(".mapping") for name in zip_file.namelist()
+        )
+
+
+VALIDATORS = {
+    OutputFormat.JSON: validate_json,
+    OutputFormat.TINY: validate_tiny,
+    OutputFormat.TINY_2: validate_tiny_2,
+    OutputFormat.ENIGMA: validate_enigma,
+}
+
+
+def verify_jar(
+    jar: CombinedJarDesc,
+    yarn: CombinedYarn,
+    yarn_tiny_sha1: str | None = None,
+) -> VerifyResult:
+    result = VerifyResult(version_id=jar.version_id, jar_key=jar.jar_key, errors=list())
+    try:
+        out_paths = {format: jar.get_out_path(format) for format in jar.formats}
+        for path in [jar.path, yarn.path, *out_paths.values()]:
+            if not path.exists():
+                result.errors.append(f"missing {path.relative_to(DIR)}")
+        if result.errors:
+            return result
+
+        result.in_sha1 = jar.input_sha1(yarn_tiny_sha1 or sha1_file(yarn.path))
+        if jar.in_sha1 is not None and result.in_sha1 != jar.in_sha1:
+            result.errors.append("inputs changed since last mappingio")
+
+        for format, path in out_paths.items():
+            result.out_sha1[format] = sha1_file(path)
+            if format in jar.out_sha1 and result.out_sha1[format] != jar.out_sha1[format]:
+                result.errors.append(f"{path.relative_to(DIR)} sha1 does not match recorded sha1")
+
+            if not VALIDATORS[format](path):
+                result.errors.append(f"{path.relative_to(DIR)} is not valid {format.value}")
+    except Exception as e:
+        result.errors.append(f"{type(e).__name__}: {e}")
+    return result
+
+
+def verify_combined(combined: CombinedCombined) -> list[VerifyResult]:
+    yarn_result = verify_yarn(combined.yarn)
+    return [
+        yarn_result,
+        *[verify_jar(jar, combined.yarn, yarn_result.tiny_sha1) for jar in combined.jars.values()],
+    ]
+
+
+def verify(combined_root: Combined, max_workers: int | None = None) -> list[VerifyResult]:
+    results = list()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # one task per version, its yarn is hashed once and shared by its jars
+        futures = [
+            executor.submit(verify_combined, combined)
+            for combined in combined_root.combined.values()
+        ]
+
+        i_max = len(futures)
+        for i, future in enumerate(futures):
+            for result in future.result():
+                results.append(result)
+
+                prefix = f"verify {progress(i + 1, i_max)} {result.name}"
+                if result.ok:
+                    logger.info(f"{prefix} ok")
+                else:
+                    logger.warning(f"{prefix} failed: {'; '.join(result.errors)}")
+
+    logger.info(f"verify done, {sum(not r.ok for r in results)}/{len(results)} failed")
+    return results
+
+
+def verify_index(combined_root: Combined, index: Index) -> list[str]:
+    errors = list()
+
+    if index.timestamp != combined_root.timestamp:
+        errors.append("index.json timestamp does not match combined.json")
+
+    for version_id, combined in combined_root.combined.items():
+        if version_id not in index.versions:
+            errors.append(f"index.json is missing {version_id}")
+        elif index.versions[version_id] != IndexVersion.from_combined(combined):
+            errors.append(f"index.json {version_id} does not match combined.json")
+
+    for version_id, index_version in index.versions.items():
+        if version_id not in combined_root.combined:
+            errors.append(f"index.json {version_id} is not in combined.json")
+        for index_jar in index_version.jars.values():
+            paths = [index_jar.path, *[f.path for f in index_jar.formats.values()]]
+            for path in dict.fromkeys(paths):
+                if not Path(DIR / path).exists():
+                    errors.append(f"index.json {version_id} references missing {path}")
+
+    for error in errors:
+        logger.warning(f"verify_index {error}")
+    logger.info(f"verify_index done, {len(errors)} errors")
+    return errors
+
+
+# record the hashes of valid entries in combined_root
+def record(combined_root: Combined, results: list[VerifyResult]) -> bool:
+    dirty = False
+
+    for result in results:
+        if not result.ok:
+            continue
+
+        combined = combined_root.combined[result.version_id]
+        if result.jar_key is None:
+            if (
+                combined.yarn.tiny_gz_sha1 != result.tiny_gz_sha1
+                or combined.yarn.tiny_sha1 != result.tiny_sha1
+            ):
+                combined.yarn.tiny_gz_sha1 = result.tiny_gz_sha1
+                combined.yarn.tiny_sha1 = result.tiny_sha1
+                dirty = True
+        else:
+            jar = combined.jars[result.jar_key]
+            if jar.in_sha1 != result.in_sha1 or jar.out_sha1 != result.out_sha1:
+                jar.in_sha1 = result.in_sha1
+                jar.out_sha1 = result.out_sha1
+                dirty = True
+
+    return dirty
+
+
+# regenerate only failed entries, repaired results are cleared and failures keep their errors
+def repair(combined_root: Combined, results: list[VerifyResult]) -> bool:
+    dirty = False
+
+    failed = [result for result in results if not result.ok]
+    failed_yarn = {result.version_id for result in failed if result.jar_key is None}
+
+    i_max = len(failed)
+    for i, result in enumerate(failed):
+        prefix = f"repair {progress(i + 1, i_max)} {result.name}"
+        combined = combined_root.combined[result.version_id]
+
+        if result.jar_key is not None and result.version_id in failed_yarn:
+            # yarn results come first, so its repair already covered this jar
+            yarn_result = next(r for r in failed if r.version_id == result.version_id)
+            if yarn_result.ok:
+                result.errors = list()
+            logger.info(f"{prefix} skipped, repaired with yarn")
+            continue
+
+        dirty = True
+        try:
+            if result.jar_key is None:
+                # new yarn invalidates every jar of this version
+                combined.yarn.download(force=True)
+                combined.mappingio(combined_root.formats)
+            else:
+                combined.jars[result.jar_key].mappingio(combined.yarn, combined_root.formats)
+        except Exception as e:
+            result.errors.append(f"repair {type(e).__name__}: {e}")
+            logger.error(f"{prefix} failed: {type(e).__name__}: {e}")
+            continue
+
+        result.errors = list()
+        logger.info(f"{prefix} repaired")
+
+    return dirty
+
+
+if __name__ == "__main__":
+    repair_mode = len(sys.argv) > 1 and sys.argv[1] == "repair"
+
+    combined = Combined.load()
+    results = verify(combined)
+
+    try:
+        index = Index.load()
+    except Exception as e:
+        logger.warning(f"Index.load failed: {type(e).__name__}: {e}")
+        index = Index.empty()
+    index_errors = verify_index(combined, index)
+
+    dirty = record(combined, results)
+    if repair_mode:
+        dirty = repair(combined, results) or dirty
+
+    if dirty:
+        combined.save()
+
+    if dirty or (repair_mode and index_errors):
+        # rebuild from scratch, Index.update skips an index with a matching timestamp
+        index = Index.empty()
+        index.update()
+        index.save()
+        index_errors = verify_index(combined, index)
+
+    if index_errors or not all(result.ok for result in results):
+        sys.exit(1)